@@ -9,24 +9,29 @@
 #
 
 import dbm
+import io
 import logging
 import marshal
+import multiprocessing
 import os
 import smtplib
 import ssl
+import struct
 import warnings
 from argparse import ArgumentParser, FileType
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
-from email.mime.image import MIMEImage
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from email.message import EmailMessage
 from email.utils import formatdate
+from functools import lru_cache, partial
 from importlib.metadata import version
 from importlib.resources import files
 from pathlib import Path
 from shutil import move
 from tempfile import NamedTemporaryFile
+from types import SimpleNamespace
 
 import adif_io
 import jinja2
@@ -47,7 +52,26 @@ FONTS = {
   'font_foot': 'VeraMono-Italic.ttf',
 }
 
+FONT_SIZES = {
+  'font_call': 24,
+  'font_text': 16,
+  'font_foot': 14,
+}
+
+DATE_FORMAT = "%A %B %d, %Y at %X UTC"
+
 CACHE_EXPIRE = 86400 * 8
+CACHE_STRUCT = struct.Struct('<d')
+
+# Smallest batch where the process pool beats rendering the cards serially.
+POOL_MIN_CARDS_FORK = 64
+POOL_MIN_CARDS_SPAWN = 256
+
+QRZ_WORKERS = 4
+# qrzlib caches the lookups itself, this cache only saves the qrz.com login.
+QRZ_CACHE_EXPIRE = 86400 * 30
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
 config = None
 
@@ -59,7 +83,7 @@ logging.basicConfig(
 warnings.filterwarnings('ignore')
 
 
-@dataclass
+@dataclass(slots=True)
 class QSOData:
   # pylint: disable=too-many-instance-attributes
   my_call: str
@@ -73,6 +97,7 @@ class QSOData:
   rst_rcvd: str
   tx_pwr: int
   timestamp: float
+  qso_date: str
   name: str
   email: str
   sota_ref: str
@@ -94,30 +119,58 @@ class QSOData:
     self.rst_rcvd = qso.get('RST_RCVD', '599')
     self.tx_pwr = int(qso.get('TX_PWR', 100))
     self.timestamp = qso_timestamp(date_on, time_on)
+    self.qso_date = datetime.fromtimestamp(self.timestamp, timezone.utc).strftime(DATE_FORMAT)
     self.name = qso.get('NAME', 'Dear OM')
     self.email = os.getenv('DEBUG_EMAIL', qso.get('EMAIL'))
-    if not self.email:
-      self.email = self.email_lookup(self.call, cfg)
     self.pota_ref = qso.get('POTA_REF')
     self.sota_ref = qso.get('SOTA_REF')
     self.lang = qso.get('COUNTRY', 'default').lower()
 
-  def email_lookup(self, call, cfg):
-    logging.warning('Email address for %s not found in the ADIF file, using qrz.com', call)
-    try:
-      key = config.qrz_key
-    except AttributeError:
-      logging.error('Impossible to retrieve the email from qrz.com: API key missing')
-      raise SystemExit('qrz.com API key missing') from None
 
-    qrz = qrzlib.QRZ()
-    qrz.authenticate(cfg.call, key)
+def _qrz_email(qrz, call):
+  try:
+    return qrz.get_call(call).email
+  except qrzlib.QRZ.NotFound:
+    logging.error('No email address found for %s', call)
+    return ''
+  except (qrzlib.QRZ.SessionError, qrzlib.QRZ.XMLError) as err:
+    logging.error('qrz.com lookup error for %s: %s', call, err)
+  return None
+
+
+def email_lookup(calls, qdb):
+  now = datetime.now(timezone.utc).timestamp()
+  emails = {}
+  for call in calls:
     try:
-      qrz.get_call(call)
-      return qrz.email
-    except qrzlib.QRZ.NotFound:
-      logging.error('No email address found for %s', call)
-    return None
+      value = qdb[f'QRZ:{call}']
+      if CACHE_STRUCT.unpack_from(value)[0] > now - QRZ_CACHE_EXPIRE:
+        emails[call] = value[CACHE_STRUCT.size:].decode('utf-8') or None
+    except (KeyError, struct.error):
+      pass
+
+  if not (missing := [call for call in calls if call not in emails]):
+    return emails
+
+  if not hasattr(config, 'qrz_key'):
+    logging.error('Impossible to retrieve the email from qrz.com: API key missing')
+    raise SystemExit('qrz.com API key missing')
+
+  for call in missing:
+    logging.warning('Email address for %s not found in the ADIF file, using qrz.com', call)
+  qrz = qrzlib.QRZ()
+  try:
+    qrz.authenticate(config.call, config.qrz_key)
+  except qrzlib.QRZ.SessionError as err:
+    logging.error('qrz.com authentication error: %s', err)
+    return emails | dict.fromkeys(missing)
+  with ThreadPoolExecutor(max_workers=min(QRZ_WORKERS, len(missing))) as executor:
+    for call, email in zip(missing, executor.map(partial(_qrz_email, qrz), missing)):
+      emails[call] = email or None
+      # Lookup errors (None) are retried on the next run, unknown calls ('') are cached.
+      if email is not None:
+        qdb[f'QRZ:{call}'] = CACHE_STRUCT.pack(now) + email.encode('utf-8')
+  return emails
 
 
 def clean_string(input_string):
@@ -129,123 +182,203 @@ def draw_rectangle(draw, coord, color=(0x44, 0x79, 0x9), width=1, fill=(0x75, 0x
   draw.rectangle(coord, outline=color, width=width)
 
 
-def build_template(data, cid):
-  if template := getattr(config, 'mail_templates'):
+@lru_cache(maxsize=16)
+def get_template(country):
+  if template := getattr(config, 'mail_templates', None):
     languages = {v.lower(): k.lower() for k, values in config.languages.items() for v in values}
-    lang = languages.get(data['lang'], 'default')
-    logging.info('Using %s template for %s', lang, data['lang'])
-    mail_template = jinja2.Template(template.get(lang, "default"))
-  elif template := getattr(config, 'mail_template'):
-    mail_template = jinja2.Template(template)
-  else:
-    raise KeyError('No email templates found')
+    lang = languages.get(country, 'default')
+    logging.info('Using %s template for %s', lang, country)
+    return jinja2.Template(template.get(lang, "default"))
+  if template := getattr(config, 'mail_template', None):
+    return jinja2.Template(template)
+  raise KeyError('No email templates found')
+
 
+def build_template(data, cid):
+  mail_template = get_template(data['lang'])
   html_content = mail_template.render(data=data, cid=cid)
   return html_content
 
 
-def send_mail(qso, image):
+@lru_cache(maxsize=None)
+def ssl_context(cafile=None):
+  context = ssl.create_default_context()
+  if cafile:
+    context.load_verify_locations(cafile)
+  return context
+
+
+class SMTPSession:
+  def __init__(self):
+    self.server = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def connect(self):
+    try:
+      self.server = smtplib.SMTP(config.smtp_server, config.smtp_port)
+      self.server.ehlo()
+      self.server.starttls(context=ssl_context(getattr(config, 'smtp_cafile', None)))
+      self.server.ehlo()
+      self.server.login(config.smtp_login, config.smtp_password)
+    except ConnectionRefusedError as err:
+      logging.error('Connection "%s" error: %s', config.smtp_server, err)
+      raise SystemExit("Exit send_mail error") from None
+    except smtplib.SMTPAuthenticationError as err:
+      logging.error('SMTP "%s": %s', config.smtp_server, err.smtp_error.decode('utf-8'))
+      raise SystemExit("Exit send_mail error") from None
+
+  def close(self):
+    if not self.server:
+      return
+    try:
+      self.server.quit()
+    except smtplib.SMTPServerDisconnected:
+      pass
+    self.server = None
+
+  def send_message(self, msg):
+    if not self.server:
+      self.connect()
+    try:
+      self.server.send_message(msg, config.smtp_from, msg['To'])
+    except smtplib.SMTPServerDisconnected:
+      logging.warning('Connection to "%s" lost, reconnecting', config.smtp_server)
+      self.connect()
+      self.server.send_message(msg, config.smtp_from, msg['To'])
+
+
+def send_mail(smtp, qso, image):
   cid = f'image_{hash(image) % 10000}'
-  msg = MIMEMultipart("related")
+  msg = EmailMessage()
   msg['From'] = config.smtp_from
   msg['To'] = qso.email
   msg['Date'] = formatdate(localtime=True)
   msg['Subject'] = f"Digital QSL from {qso.my_call} to {qso.call}"
 
-  data = asdict(qso)
-  data['qso_date'] = datetime.fromtimestamp(qso.timestamp).strftime("%A %B %d, %Y at %X UTC")
-
-  email_content = build_template(data, cid)
-  msg.attach(MIMEText(email_content, "html"))
+  email_content = build_template(asdict(qso), cid)
+  msg.set_content(email_content, subtype='html')
+  msg.add_related(image, maintype='image', subtype='jpeg', cid=f'<{cid}>',
+                  disposition='inline', filename=f"EQSL-{clean_string(qso.call)}.jpg")
 
   logging.info('Sending qsl to: %s', qso.email)
-  with open(image, "rb") as fdi:
-    img = MIMEImage(fdi.read())
-    img.add_header("Content-ID", cid)
-    img.add_header("Content-Disposition", "inline", filename=f"{os.path.basename(image)}")
-    msg.attach(img)
-
-  context = ssl.create_default_context()
   try:
-    with smtplib.SMTP(config.smtp_server, config.smtp_port) as server:
-      server.ehlo()
-      server.starttls(context=context)
-      server.ehlo()
-      server.login(config.smtp_login, config.smtp_password)
-      server.sendmail(config.smtp_from, qso.email, msg.as_string())
-  except ConnectionRefusedError as err:
-    logging.error('Connection "%s" error: %s', config.smtp_server, err)
-    raise SystemExit("Exit send_mail error") from None
-  except (smtplib.SMTPDataError, smtplib.SMTPAuthenticationError) as err:
+    smtp.send_message(msg)
+  except smtplib.SMTPDataError as err:
     logging.error('SMTP "%s": %s', config.smtp_server, err.smtp_error.decode('utf-8'))
     raise SystemExit("Exit send_mail error") from None
 
 
-def card(qso, signature, image_name=None):
-  # pylint: disable=too-many-locals
-  width = NEW_WIDTH
+@lru_cache(maxsize=None)
+def load_font(font_path, size):
+  return ImageFont.truetype(font_path, size)
 
-  img = Image.open(config.qsl_card)
-  img = img.convert("RGBA")
-  img.info['comment'] = 'QSL Card generated by http://github.com/0x9900/QSL/'
 
-  if img.size[0] < NEW_WIDTH and img.size < 576:
+def load_card(card_path):
+  img = Image.open(card_path)
+
+  if img.size[0] < NEW_WIDTH or img.size[1] < 576:
     logging.error("The card resolution should be at least 1024x576")
     raise SystemExit("Exit with error")
 
-  font_call = ImageFont.truetype(config.font_call, 24)
-  font_text = ImageFont.truetype(config.font_text, 16)
-  font_foot = ImageFont.truetype(config.font_foot, 14)
+  img.draft('RGB', (NEW_WIDTH, NEW_WIDTH * 9 // 16))
+  # Drawing in RGBA mode on an RGB image blends the translucent colors in place.
+  img = img.convert("RGB")
 
   h_size, v_size = img.size
-  ratio = width / h_size
+  ratio = NEW_WIDTH / h_size
   vsize = int(v_size * ratio)
-  img = img.resize((width, vsize), Image.Resampling.LANCZOS)
+  img = img.resize((NEW_WIDTH, vsize), Image.Resampling.LANCZOS, reducing_gap=3.0)
+  img.info['comment'] = 'QSL Card generated by http://github.com/0x9900/QSL/'
+  return img
+
+
+def card_background(img, overlay_color, font_foot):
+  vsize = img.size[1]
+  draw = ImageDraw.Draw(img, 'RGBA')
+  draw_rectangle(draw, ((112, vsize-230), (912, vsize-20)), width=3, fill=overlay_color)
+  font = load_font(font_foot, FONT_SIZES['font_foot'])
+  draw.text((NEW_WIDTH-90, vsize-30), '@0x9900', font=font, fill=(0x70, 0x70, 0xa0))
+  return img
 
-  overlay = Image.new('RGBA', img.size)
-  draw = ImageDraw.Draw(overlay)
-  draw_rectangle(draw, ((112, vsize-230), (912, vsize-20)), width=3, fill=config.overlay_color)
 
-  textbox = ImageDraw.Draw(overlay)
-  date = datetime.fromtimestamp(qso.timestamp).strftime("%A %B %d, %Y at %X UTC")
+def card(qso, signature):
+  # pylint: disable=too-many-locals
+  img = config.base_card.copy()
+  vsize = img.size[1]
+
+  font_call = load_font(config.font_call, FONT_SIZES['font_call'])
+  font_text = load_font(config.font_text, FONT_SIZES['font_text'])
+  font_foot = load_font(config.font_foot, FONT_SIZES['font_foot'])
+
+  textbox = ImageDraw.Draw(img, 'RGBA')
+
   y_pos = vsize - 220
   x_pos = 132
   textbox.text((x_pos+10, y_pos), f"To: {qso.call}  From: {qso.my_call}",
                font=font_call, fill=config.text_color)
-  textstr = (f'Mode: {qso.mode} • Band: {qso.band} • RST Send: {qso.rst_sent} • '
-             f'RST Received: {qso.rst_rcvd}')
-  textbox.text((x_pos, y_pos+40), textstr, font=font_text, fill=config.text_color)
-  textbox.text((x_pos, y_pos+65), f'Date: {date}', font=font_text, fill=config.text_color)
-  textbox.text((x_pos, y_pos+90), f' Rig: {qso.my_rig} • Power: {int(qso.tx_pwr):d} Watt',
-               font=font_text, fill=config.text_color)
-  textbox.text((x_pos, y_pos+115), (f'Grid: {qso.my_gridsquare} • ITU Zone: {config.ituzone} • '
-                                    f'CQ Zone: {config.cqzone}'),
-               font=font_text, fill=config.text_color)
+  lines = [
+    (f'Mode: {qso.mode} • Band: {qso.band} • RST Send: {qso.rst_sent} • '
+     f'RST Received: {qso.rst_rcvd}'),
+    f'Date: {qso.qso_date}',
+    f' Rig: {qso.my_rig} • Power: {int(qso.tx_pwr):d} Watt',
+    f'Grid: {qso.my_gridsquare} • ITU Zone: {config.ituzone} • CQ Zone: {config.cqzone}',
+  ]
   if qso.sota_ref:
-    textbox.text((x_pos, y_pos+140), f'SOTA: Summit Reference ({qso.sota_ref})',
-                 font=font_text, fill=config.text_color)
+    lines.append(f'SOTA: Summit Reference ({qso.sota_ref})')
   elif qso.pota_ref:
-    textbox.text((x_pos, y_pos+140), f'POTA: Park Reference ({qso.pota_ref})',
-                 font=font_text, fill=config.text_color)
+    lines.append(f'POTA: Park Reference ({qso.pota_ref})')
+  spacing = 25 - font_text.getbbox('A')[3]
+  textbox.multiline_text((x_pos, y_pos+40), '\n'.join(lines), font=font_text,
+                         fill=config.text_color, spacing=spacing)
 
   textbox.text((x_pos, y_pos+165), signature, font=font_foot, fill=config.text_color)
 
-  textbox.text((NEW_WIDTH-90, vsize-30), '@0x9900', font=font_foot, fill=(0x70, 0x70, 0xa0))
-
-  img = Image.alpha_composite(img, overlay)
-  img = img.convert("RGB")
-
-  if not image_name:
-    image_name = NamedTemporaryFile(prefix=f'EQSL-{clean_string(qso.call)}-',
-                                    suffix='.jpg', delete=False).name
-  img.save(image_name, "JPEG", quality=80, optimize=True, progressive=True)
+  buffer = io.BytesIO()
+  img.save(buffer, "JPEG", quality=80, subsampling=2)
   if config.show_cards:
     img.show()
-  return image_name
+  return buffer.getvalue()
+
+
+def save_card(qso, image):
+  with NamedTemporaryFile(prefix=f'EQSL-{clean_string(qso.call)}-', suffix='.jpg',
+                          delete=False) as fdo:
+    fdo.write(image)
+  logging.info('Card for %s saved in %s', qso.call, fdo.name)
+
+
+def _init_worker(cfg):
+  global config  # pylint: disable=global-statement
+  config = cfg
+
+
+def render_cards(qsos):
+  workers = min(os.cpu_count() or 1, len(qsos))
+  # Don't lock in the start method, the caller may still set it.
+  method = (multiprocessing.get_start_method(allow_none=True)
+            or multiprocessing.get_all_start_methods()[0])
+  if method == 'fork':
+    min_cards = POOL_MIN_CARDS_FORK
+  else:
+    min_cards = POOL_MIN_CARDS_SPAWN
+  if workers < 2 or len(qsos) < min_cards:
+    yield from (card(qso, config.signature) for qso in qsos)
+    return
+
+  with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                           initargs=(config,)) as executor:
+    yield from executor.map(partial(card, signature=config.signature), qsos)
 
 
+@lru_cache(maxsize=1024)
 def qso_timestamp(day, time='0000'):
-  _dt = datetime.strptime(day + time[:-2], '%Y%m%d%H%M')
+  _dt = datetime(int(day[0:4]), int(day[4:6]), int(day[6:8]),
+                 int(time[0:2]), int(time[2:4]), tzinfo=timezone.utc)
   return _dt.timestamp()
 
 
@@ -257,7 +390,11 @@ def _read_config():
       logging.debug('Reading config file: %s', filename)
       try:
         with open(filename, 'r', encoding='utf-8') as cfd:
-          return yaml.safe_load(cfd)
+          mtime = os.fstat(cfd.fileno()).st_mtime
+          _config = yaml.load(cfd, Loader=YAML_LOADER)
+        _config['config_file'] = filename
+        _config['config_mtime'] = mtime
+        return _config
       except ValueError as err:
         logging.error('Configuration error "%s"', err)
         break
@@ -277,28 +414,58 @@ def read_config():
   for color_name in ('overlay_color', 'text_color'):
     _config[color_name] = tuple(_config[color_name])
 
-  for font_name in ("font_call", "font_text", "font_foot"):
+  for font_name, font_file in FONTS.items():
     font_path = _config.get(font_name)
     if not font_path:
       logging.warning('Font "%s" not configured. Using the default font', font_name)
-      _config[font_name] = files('eqsl.fonts').joinpath(FONTS[font_name])
-    elif not os.path.isfile(font_path):
-      logging.warning('Font "%s" not found, using the default font', font_path)
-      _config[font_name] = files('eqsl.fonts').joinpath(FONTS[font_name])
     else:
-      _config[font_name] = font_path
+      try:
+        load_font(font_path, FONT_SIZES[font_name])
+      except OSError:
+        logging.warning('Font "%s" not found, using the default font', font_path)
+        font_path = None
+    _config[font_name] = font_path or files('eqsl.fonts').joinpath(font_file)
 
   card_path = _config.get('qsl_card')
+  base_card = None
   if not card_path:
     logging.warning('QSL Card not configured. Using the default QSL Card')
-    _config['qsl_card'] = files('eqsl.card').joinpath('default.jpg')
-  elif not os.path.isfile(card_path):
-    logging.warning('QSL Card "%s" not found, using the default QSL Card', card_path)
-    _config['qsl_card'] = files('eqsl.card').joinpath('default.jpg')
   else:
-    _config['qsl_card'] = card_path
+    try:
+      base_card = load_card(card_path)
+    except OSError:
+      logging.warning('QSL Card "%s" not found, using the default QSL Card', card_path)
+  if base_card is None:
+    card_path = files('eqsl.card').joinpath('default.jpg')
+    base_card = load_card(card_path)
+  _config['qsl_card'] = card_path
+  _config['base_card'] = card_background(base_card, _config['overlay_color'],
+                                         _config['font_foot'])
+
+  if cafile := _config.get('smtp_cafile'):
+    try:
+      ssl_context(cafile)
+    except OSError as err:
+      logging.error('Error loading smtp_cafile "%s": %s', cafile, err)
+      raise SystemExit("Exit with error") from None
+
+  return SimpleNamespace(**_config)
 
-  return type('Config', (object, ), _config)
+
+def config_changed():
+  try:
+    return os.stat(config.config_file).st_mtime != config.config_mtime
+  except OSError:
+    return True
+
+
+def reload_config():
+  global config  # pylint: disable=global-statement
+  logging.info('Reading the configuration file')
+  get_template.cache_clear()
+  ssl_context.cache_clear()
+  load_font.cache_clear()
+  config = read_config()
 
 
 def move_adif(adif_file):
@@ -312,25 +479,40 @@ def move_adif(adif_file):
     move(src, dest)
 
 
-def already_sent(qso):
+@contextmanager
+def open_cache(filename):
+  try:
+    qdb = dbm.open(filename, 'c')
+  except dbm.error as err:
+    logging.warning('Cache "%s" not available: %s', filename, err)
+    yield {}
+    return
+  with qdb:
+    yield qdb
+
+
+def cache_time(value):
+  try:
+    return CACHE_STRUCT.unpack(value)[0]
+  except struct.error:
+    pass
+  # Entries written by older versions are a marshalled copy of the QSO.
+  try:
+    return marshal.loads(value)['_cache_time']
+  except (EOFError, ValueError, TypeError, KeyError):
+    return 0
+
+
+def already_sent(qso, qdb):
   key = f'{qso.call}-{qso.band}-{qso.mode}'.upper()
+  now = datetime.now(timezone.utc).timestamp()
   try:
-    with dbm.open(config.qsl_cache, 'r') as qdb:
-      cached = marshal.loads(qdb[key])
-    if cached['_cache_time'] > datetime.now(timezone.utc).timestamp() - CACHE_EXPIRE:
+    if cache_time(qdb[key]) > now - CACHE_EXPIRE:
       return True
-  except dbm.error:
-    pass
-  except (KeyError, IOError):
+  except KeyError:
     pass
 
-  try:
-    with dbm.open(config.qsl_cache, 'c') as qdb:
-      cache = asdict(qso)
-      cache['_cache_time'] = datetime.now(timezone.utc).timestamp()
-      qdb[key] = marshal.dumps(cache)
-  except IOError as err:
-    logging.warning(err)
+  qdb[key] = CACHE_STRUCT.pack(now)
   return False
 
 
@@ -352,22 +534,22 @@ def parse_args():
   return parser.parse_args()
 
 
-def main():
-  global config  # pylint: disable=global-statement
-  config = read_config()
-  opts = parse_args()
+def run(adif_file, show=False, keep=False, resend=False):
+  # sendcard calls run() on each new ADIF file, pick up the changes made to eqsl.yaml.
+  if config is None or config_changed():
+    reload_config()
 
-  config.show_cards = bool(opts.show)
+  config.show_cards = bool(show)
 
   try:
-    qsos_raw, _ = adif_io.read_from_string(opts.adif_file.read())
+    qsos_raw, _ = adif_io.read_from_string(adif_file.read())
   except IndexError:
-    logging.error('Error reading the ADIF file "%s"', opts.adif_file.name)
+    logging.error('Error reading the ADIF file "%s"', adif_file.name)
     raise SystemExit("Exit with error") from None
   finally:
-    opts.adif_file.close()
-  if not opts.keep:
-    move_adif(opts.adif_file)
+    adif_file.close()
+  if not keep:
+    move_adif(adif_file)
 
   # Load all the QSOs information.
   all_qso = []
@@ -377,20 +559,37 @@ def main():
     except KeyError as err:
       logging.error('Record ignored the ADIF file is missing the key: %s', err)
 
+  if missing := sorted({qso.call for qso in all_qso if not qso.email}):
+    with open_cache(config.qsl_cache) as qdb:
+      emails = email_lookup(missing, qdb)
+    for qso in all_qso:
+      qso.email = qso.email or emails[qso.call]
+
+  images = render_cards(all_qso)
+
   # Send cards
-  for qso in all_qso:
-    image_name = card(qso, config.signature)
-    if not opts.resend and already_sent(qso):
-      logging.warning('QSL for %s already sent to %s', qso.call, qso.email)
-      continue
-    if not qso.email:
-      logging.warning('No email found for %s', qso.call)
-      continue
+  with open_cache(config.qsl_cache) as qdb, SMTPSession() as smtp:
+    for qso, image in zip(all_qso, images):
+      if keep:
+        save_card(qso, image)
+      if not resend and already_sent(qso, qdb):
+        logging.warning('QSL for %s already sent to %s', qso.call, qso.email)
+        continue
+      if not qso.email:
+        logging.warning('No email found for %s', qso.call)
+        continue
 
-    try:
-      send_mail(qso, image_name)
-    except smtplib.SMTPRecipientsRefused:
-      logging.warning('Error Recipient "%s" malformed', qso.email)
+      try:
+        send_mail(smtp, qso, image)
+      except smtplib.SMTPRecipientsRefused:
+        logging.warning('Error Recipient "%s" malformed', qso.email)
+
+
+def main():
+  global config  # pylint: disable=global-statement
+  config = read_config()
+  opts = parse_args()
+  run(opts.adif_file, opts.show, opts.keep, opts.resend)
 
 
 if __name__ == "__main__":
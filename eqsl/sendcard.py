@@ -6,21 +6,20 @@
 
 """
 `sendcard` is a companion program for e-qsl (https://pypi.org/project/e-qsl/)
-This program monitors a directory for an ADIF file and then calls `eqsl`
-with the file as an argument.
+This program monitors a directory for an ADIF file and then runs `eqsl`
+on that file. Changes to eqsl.yaml are picked up on the next ADIF file.
 """
 
 import logging
 import os
-import shutil
 from argparse import ArgumentParser
 from importlib.metadata import version
 from pathlib import Path
-from subprocess import call
-from typing import Optional
 
 from watchfiles import Change, DefaultFilter, watch
 
+from eqsl import run
+
 SHOW_CARD = False
 
 logging.basicConfig(
@@ -34,16 +33,14 @@ __version__ = version("e-qsl")
 
 
 def send_cards(filename: Path, show_card: bool) -> None:
-  eqsl: Optional[str] = shutil.which('eqsl')
-  if not eqsl:
-    raise FileNotFoundError('eqsl not found')
-
-  args: list[str] = [eqsl, '-a', str(filename)]
-  if show_card:
-    args.append('-s')
-
-  logging.info('Command: %s', ' '.join(args))
-  call(args)
+  logging.info('Running eqsl on %s', filename)
+  try:
+    with open(filename, 'r', encoding='utf-8') as fdi:
+      run(fdi, show=show_card)
+  except SystemExit as err:
+    logging.error('eqsl error: %s', err)
+  except Exception:  # pylint: disable=broad-exception-caught
+    logging.exception('eqsl error processing %s', filename)
 
 
 class ADIFilter(DefaultFilter):
@@ -63,16 +60,15 @@ def sendcard() -> None:
                       help="Show the card")
   parser.add_argument("-a", "--adif", required=True,
                       help="ADIF file name")
+  parser.add_argument("-d", "--debounce", type=int, default=400,
+                      help="Wait time in ms to group file changes [default: %(default)s]")
   parser.add_argument("--version", action="version", version=f'eqsl.%(prog)s {__version__}')
   opts = parser.parse_args()
 
   full_name = Path(opts.adif).expanduser().absolute()
   if full_name.exists():
     logging.info('The ADIF file already exists. Sending cards.')
-    try:
-      send_cards(full_name, opts.show)
-    except FileNotFoundError as err:
-      logging.debug(err)
+    send_cards(full_name, opts.show)
 
   path = full_name.parent
   adif_file = full_name.parts[-1]
@@ -82,15 +78,15 @@ def sendcard() -> None:
 
   watch_filter = ADIFilter(path, adif_file)
   logging.info('Sendcards watching %s for %s', path, adif_file)
-  for changes in watch(path, watch_filter=watch_filter, recursive=False):
-    for change, filename in changes:
-      filename = Path(filename)
-      if change in (Change.added, Change.modified):
-        if not filename.exists():
-          continue
-        logging.info('Sending cards...')
-        send_cards(filename, opts.show)
-        logging.info('All the card sent. Back to watching %s', path)
+  for changes in watch(path, watch_filter=watch_filter, recursive=False,
+                       debounce=opts.debounce, step=50):
+    if not any(c in (Change.added, Change.modified) for c, _ in changes):
+      continue
+    if not full_name.exists():
+      continue
+    logging.info('Sending cards...')
+    send_cards(full_name, opts.show)
+    logging.info('All the card sent. Back to watching %s', path)
 
 
 def main():